@@ -1,24 +1,76 @@
 import streamlit as st
 import os
-import arxiv
-import sqlite3
-import uuid
-from datetime import datetime, timedelta, timezone # [수정] timezone, timedelta 추가
+import httpx
+import tiktoken
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from openai import AzureOpenAI
 from dotenv import load_dotenv
 
-# 1. 환경 변수 로드
-load_dotenv()
+from paper_mate.arxiv_client import MAX_ARXIV_RESULTS, fetch_arxiv
+from paper_mate.db import (
+    create_session,
+    delete_session,
+    get_all_sessions,
+    get_session_activity,
+    get_session_info,
+    get_session_summary,
+    get_session_view,
+    init_db,
+    maybe_maintain_db,
+    most_recent_session_id,
+    save_message,
+    save_messages_bulk,
+    search_history,
+    update_session_summary,
+    update_session_title,
+)
 
 # Streamlit 페이지 설정
 st.set_page_config(page_title="Paper Mate Pro", page_icon="📚", layout="wide")
 
-# 2. Azure OpenAI 클라이언트 설정
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OAI_KEY"),
-    api_version="2024-05-01-preview",
-    azure_endpoint=os.getenv("AZURE_OAI_ENDPOINT")
-)
+# API 클라이언트 설정 (rerun 사이에 재사용)
+@st.cache_resource
+def get_openai_client():
+    # .env 파일은 클라이언트를 처음 만들 때 한 번만 읽는다
+    load_dotenv()
+    # 응답이 늦는 요청은 오래 붙잡지 않고 재시도한다
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OAI_KEY"),
+        api_version="2024-05-01-preview",
+        azure_endpoint=os.getenv("AZURE_OAI_ENDPOINT"),
+        timeout=httpx.Timeout(15.0, connect=5.0),
+        max_retries=2,
+        # HTTP/2로 한 연결에서 요청을 다중화하고, 유휴 연결을 60초 동안 유지해 TLS 핸드셰이크를 줄인다
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=16, max_connections=32, keepalive_expiry=60)
+        )
+    )
+
+@st.cache_resource
+def get_token_encoder():
+    # gpt-4o 계열이 쓰는 토크나이저. 처음 쓸 때 BPE 파일을 내려받으므로,
+    # 실패하면 None을 캐시해 매 턴 다시 내려받지 않고 글자 수로 어림한다
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+@st.cache_resource
+def get_executor():
+    # ArXiv 검색을 제한 시간(ARXIV_TIMEOUT)까지만 기다리기 위한 공용 스레드 풀
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def get_summary_executor():
+    # 대화 요약은 응답을 기다리지 않는 백그라운드 작업이므로 별도 풀에서 돌린다.
+    # 공용 풀에 넣으면 대기 시간이 번역/검색의 제한 시간을 잡아먹는다
+    return ThreadPoolExecutor(max_workers=2)
+
+@st.cache_resource
+def get_pending_summaries():
+    # 요약 작업이 진행 중인 세션 id. 같은 구간을 중복으로 요약하지 않게 한다
+    return set()
 
 # --- [인용 스타일 데이터] ---
 CITATION_STYLES = {
@@ -32,128 +84,104 @@ CITATION_STYLES = {
     "자연과학2 - APA": "APA Style (7th Edition)",
     "자연과학3 - Chicago AD": "Chicago Style (Author-Date)",
 }
+# 선택 상자 옵션은 rerun마다 새로 만들지 않고 한 번만 만든다
+CITATION_STYLE_KEYS = tuple(CITATION_STYLES)
 
-# --- [데이터베이스 관리 함수] ---
-DB_NAME = "chat_history.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
-            title TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            role TEXT,
-            content TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(session_id) REFERENCES sessions(id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def create_session(title="새로운 대화"):
-    session_id = str(uuid.uuid4())
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # [수정 핵심] 한국 시간(KST) 설정 (UTC+9)
-    KST = timezone(timedelta(hours=9))
-    timestamp = datetime.now(KST).strftime("%Y-%m-%d %H:%M")
-    
-    c.execute("INSERT INTO sessions (id, title, created_at) VALUES (?, ?, ?)", 
-              (session_id, title, timestamp))
-    conn.commit()
-    conn.close()
-    return session_id
-
-def update_session_title(session_id, new_title):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE sessions SET title = ? WHERE id = ?", (new_title, session_id))
-    conn.commit()
-    conn.close()
-
-def delete_session(session_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-    c.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-    conn.commit()
-    conn.close()
-
-def get_session_info(session_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT title, created_at FROM sessions WHERE id = ?", (session_id,))
-    row = c.fetchone()
-    conn.close()
-    return row if row else ("알 수 없음", "")
-
-def save_message(session_id, role, content):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)", 
-              (session_id, role, content))
-    conn.commit()
-    conn.close()
-
-def get_messages(session_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT role, content FROM messages WHERE session_id = ? ORDER BY id ASC", (session_id,))
-    rows = c.fetchall()
-    conn.close()
-    return [{"role": row[0], "content": row[1]} for row in rows]
-
-def get_all_sessions():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, title, created_at FROM sessions ORDER BY created_at DESC")
-    sessions = c.fetchall()
-    conn.close()
-    return sessions
-
-def search_history(keyword):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    query = f"%{keyword}%"
-    c.execute('''
-        SELECT DISTINCT s.id, s.title, m.content 
-        FROM messages m
-        JOIN sessions s ON m.session_id = s.id
-        WHERE m.content LIKE ?
-        ORDER BY m.created_at DESC
-    ''', (query,))
-    results = c.fetchall()
-    conn.close()
-    return results
+# 사이드바 대화 목록을 한 번에 보여줄 개수
+SIDEBAR_PAGE_SIZE = 30
+
+# 대화 화면에 한 번에 그릴 메시지 개수 (그 이전 메시지는 버튼을 눌러야 그린다)
+MESSAGE_PAGE_SIZE = 30
+
+# 이보다 짧은 검색어는 결과가 무의미하게 많아지므로 검색하지 않는다
+MIN_SEARCH_LENGTH = 2
+
+# 요약 뒤에 원문 그대로 보낼 최근 메시지 개수와 토큰 예산 (둘 중 먼저 닿는 한도까지만 보낸다)
+HISTORY_WINDOW = 6
+HISTORY_TOKEN_BUDGET = 4000
+
+# 요약되지 않은 메시지가 HISTORY_WINDOW보다 이만큼(세 턴) 더 쌓이면 오래된 부분을 요약에 합친다.
+# 요약 호출을 몇 턴에 한 번으로 줄이고, 그 사이 원문 길이는 HISTORY_TOKEN_BUDGET으로 제한한다
+SUMMARY_INTERVAL = HISTORY_WINDOW
+
+# 첫 답변의 첫 줄에 대화 제목을 함께 받아 제목 생성 호출을 따로 하지 않는다
+TITLE_PREFIX = "TITLE:"
+
+# 이 단어 수 이하이고 문장 부호가 없는 영어 입력은 번역/키워드 추출 없이 그대로 검색한다
+MAX_KEYWORD_WORDS = 5
+SENTENCE_PUNCTUATION = "?!.,"
+
+# --- [네트워크 호출 제한 시간 (초)] ---
+TRANSLATE_TIMEOUT = 20
+ARXIV_TIMEOUT = 15
 
 # --- [API 및 LLM 기능 함수] ---
 
+@st.cache_data(ttl=86400, show_spinner=False)
+def cached_translate(query):
+    # 번역은 검색 전에 끝나야 하므로 재시도 없이 TRANSLATE_TIMEOUT 안에 끝나지 않으면 포기한다
+    response = get_openai_client().with_options(
+        timeout=httpx.Timeout(TRANSLATE_TIMEOUT, connect=5.0), max_retries=0
+    ).chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "Translate/Summarize user query to English keywords for ArXiv search. Only keywords."},
+            {"role": "user", "content": query}
+        ],
+        temperature=0
+    )
+    return response.choices[0].message.content.strip()
+
+def squash_spaces(text):
+    # 공백만 다른 같은 질의가 같은 캐시 항목을 쓰도록 정규화 (ArXiv의 AND/OR 연산자 때문에 대소문자는 유지)
+    return " ".join(text.split())
+
+def looks_like_keywords(text):
+    # 짧고 문장 부호가 없는 영어(ASCII) 입력만 이미 검색어로 본다.
+    # 영어 문장은 ArXiv가 모든 단어를 AND로 묶어 결과가 줄어드므로 키워드 추출을 거친다
+    words = text.split()
+    return (text.isascii() and any(c.isalpha() for c in text)
+            and len(words) <= MAX_KEYWORD_WORDS
+            and not any(c in SENTENCE_PUNCTUATION for c in text))
+
 def translate_to_english_keyword(user_query):
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Translate/Summarize user query to English keywords for ArXiv search. Only keywords."},
-                {"role": "user", "content": user_query}
-            ]
-        )
-        return response.choices[0].message.content.strip()
+        return cached_translate(squash_spaces(user_query))
     except Exception:
         return user_query
 
+def stream_chat(messages):
+    stream = get_openai_client().chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        stream=True
+    )
+    for chunk in stream:
+        # Azure는 콘텐츠 필터 결과만 담긴 (choices가 빈) 청크를 먼저 보낸다
+        if chunk.choices:
+            yield chunk.choices[0].delta.content or ""
+
+def split_title_line(chunks, holder):
+    # 첫 줄이 "TITLE: ..." 이면 화면에 내보내지 않고 holder["title"]에 담는다
+    chunks = iter(chunks)
+    head = ""
+    for chunk in chunks:
+        head += chunk
+        # 첫 줄이 끝났거나 TITLE 줄이 아닌 것이 확실해지면 바로 스트리밍을 이어간다
+        stripped = head.lstrip()
+        if "\n" in stripped or not TITLE_PREFIX.startswith(stripped[:len(TITLE_PREFIX)]):
+            break
+    first_line, _, rest = head.lstrip().partition("\n")
+    if first_line.strip().startswith(TITLE_PREFIX):
+        holder["title"] = first_line.strip()[len(TITLE_PREFIX):].strip()
+        head = rest.lstrip("\n")
+    if head:
+        yield head
+    yield from chunks
+
 def generate_auto_title(user_query):
     try:
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Summarize the user's query into a concise Korean title (max 15 characters, no quotes)."},
@@ -165,75 +193,138 @@ def generate_auto_title(user_query):
         return "새로운 대화"
 
 def search_arxiv(query, max_results=3):
+    future = get_executor().submit(fetch_arxiv, squash_spaces(query), max_results)
     try:
-        client = arxiv.Client()
-        search = arxiv.Search(
-            query=query,
-            max_results=max_results * 4, 
-            sort_by=arxiv.SortCriterion.Relevance
-        )
-        results = list(client.results(search))
-        
-        if not results:
-            return None, 0
-
-        results.sort(key=lambda x: x.published, reverse=True)
-        results = results[:max_results]
-
-        results_text = []
-        for result in results:
-            authors = ", ".join([author.name for author in result.authors])
-            published_year = result.published.strftime("%Y")
-            
-            paper_data = f"""
-            [Paper ID: {result.entry_id}]
-            - Title: {result.title}
-            - Authors: {authors}
-            - Published Year: {published_year}
-            - Abstract: {result.summary.replace(chr(10), " ")} 
-            - PDF Link: {result.pdf_url}
-            """
-            results_text.append(paper_data)
-        
-        return "\n\n".join(results_text), len(results)
-
+        return future.result(timeout=ARXIV_TIMEOUT)
+    except FutureTimeoutError:
+        # 아직 대기열에 있는 검색은 실패를 알린 뒤에 실행되지 않도록 취소한다
+        future.cancel()
+        st.error(f"ArXiv 응답이 {ARXIV_TIMEOUT}초 안에 오지 않았습니다. 잠시 후 다시 시도해주세요.")
+        return None, 0
     except Exception as e:
         st.error(f"ArXiv 검색 오류: {e}")
         return None, 0
 
+def trim_history(messages):
+    # 최근 메시지부터 거꾸로 담다가 토큰 예산을 넘으면 멈춘다.
+    # 요약 이후의 메시지만 받으므로 보통 HISTORY_WINDOW ~ HISTORY_WINDOW + SUMMARY_INTERVAL개다
+    if not messages:
+        return []
+    encoder = get_token_encoder()
+    budget = HISTORY_TOKEN_BUDGET
+    kept = []
+    for role, content in reversed(messages[-(HISTORY_WINDOW + SUMMARY_INTERVAL):]):
+        cost = len(encoder.encode(content)) if encoder else len(content) // 2
+        if cost > budget:
+            break
+        budget -= cost
+        kept.append({"role": role, "content": content})
+    kept.reverse()
+    return kept
+
+def refresh_summary(session_id, previous_summary, messages, summary_count):
+    # 이전 요약에 새로 밀려난 메시지를 합쳐 요약을 갱신한다 (백그라운드 스레드에서 실행)
+    transcript = "\n".join(f"{role}: {content}" for role, content in messages)
+    if previous_summary:
+        transcript = f"[이전 요약]\n{previous_summary}\n\n[이어진 대화]\n{transcript}"
+    try:
+        response = get_openai_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "Summarize this conversation in Korean in a few sentences. Keep paper titles and the user's research interests."},
+                {"role": "user", "content": transcript}
+            ],
+            temperature=0
+        )
+        update_session_summary(session_id, response.choices[0].message.content.strip(), summary_count)
+    except Exception:
+        # 요약은 부가 기능이므로 실패하면 다음 턴에 다시 시도한다
+        pass
+    finally:
+        get_pending_summaries().discard(session_id)
+
+def maybe_refresh_summary(session_id, messages, summary, summary_count):
+    # 최근 HISTORY_WINDOW개는 원문 그대로 두고 그보다 오래된 메시지를 요약에 넣는다
+    if len(messages) - summary_count < HISTORY_WINDOW + SUMMARY_INTERVAL:
+        return
+    pending = get_pending_summaries()
+    if session_id in pending:
+        return
+    pending.add(session_id)
+    new_count = len(messages) - HISTORY_WINDOW
+    get_summary_executor().submit(refresh_summary, session_id, summary,
+                                  messages[summary_count:new_count], new_count)
+
+def translate_and_search(user_query, max_results=3):
+    # 이미 영어 키워드인 입력은 번역 호출 없이 바로 검색한다.
+    # 번역이 실패하거나 제한 시간을 넘기면 원문 그대로 검색한다
+    if looks_like_keywords(user_query):
+        english_query = user_query
+    else:
+        english_query = translate_to_english_keyword(user_query)
+    search_context, paper_count = search_arxiv(english_query, max_results)
+    return english_query, search_context, paper_count
+
 # --- [메인 앱 로직] ---
 
 init_db()
+maybe_maintain_db()
 
 if "current_session_id" not in st.session_state:
     st.session_state.current_session_id = None
 
+# --- [버튼 콜백] ---
+# 콜백은 스크립트 실행 전에 처리되므로 st.rerun() 없이 한 번의 실행으로 화면이 갱신된다
+
+def _set_session(session_id):
+    st.session_state.current_session_id = session_id
+
+def _pick_session():
+    st.session_state.current_session_id = st.session_state.session_picker
+
+def _new_session():
+    st.session_state.current_session_id = create_session()
+
+def _rename_session(session_id):
+    update_session_title(session_id, st.session_state[f"input_{session_id}"])
+
+def _delete_session(session_id):
+    delete_session(session_id)
+    if st.session_state.current_session_id == session_id:
+        st.session_state.current_session_id = None
+
+def _show_more_sessions():
+    st.session_state.sidebar_limit += SIDEBAR_PAGE_SIZE
+
+def _show_earlier_messages():
+    st.session_state.visible_messages += MESSAGE_PAGE_SIZE
+
+if not st.session_state.current_session_id:
+    st.session_state.current_session_id = most_recent_session_id() or create_session()
+
 # --- [사이드바 UI] ---
 with st.sidebar:
     st.title("🗂️ 대화 관리")
     
     # 1. 대화 검색
-    search_query = st.text_input("🔍 대화 검색", placeholder="키워드 입력...")
-    if search_query:
+    search_query = st.text_input("🔍 대화 검색", placeholder="키워드 입력...").strip()
+    if search_query and len(search_query) < MIN_SEARCH_LENGTH:
+        st.caption(f"{MIN_SEARCH_LENGTH}글자 이상 입력하세요.")
+    elif search_query:
         st.caption("검색 결과")
         results = search_history(search_query)
         if results:
             for idx, (s_id, s_title, content_snippet) in enumerate(results):
-                snippet = content_snippet[:20] + "..."
                 btn_key = f"search_res_{s_id}_{idx}" 
-                if st.button(f"📄 {s_title}\nMatch: {snippet}", key=btn_key, use_container_width=True):
-                    st.session_state.current_session_id = s_id
-                    st.rerun()
+                st.button(f"📄 {s_title}\nMatch: {content_snippet}", key=btn_key, use_container_width=True,
+                          on_click=_set_session, args=(s_id,))
         else:
             st.info("결과 없음")
 
     st.divider()
 
     # 2. 새 대화 시작
-    if st.button("➕ 새 대화 시작", use_container_width=True):
-        new_id = create_session()
-        st.session_state.current_session_id = new_id
-        st.rerun()
+    st.button("➕ 새 대화 시작", use_container_width=True, on_click=_new_session)
 
     st.divider()
 
@@ -242,7 +333,7 @@ with st.sidebar:
     
     selected_style_key = st.selectbox(
         "논문 분야 (인용 형식)",
-        options=list(CITATION_STYLES.keys()),
+        options=CITATION_STYLE_KEYS,
         index=0
     )
     target_citation_style = CITATION_STYLES[selected_style_key]
@@ -250,7 +341,7 @@ with st.sidebar:
     target_paper_count = st.number_input(
         "검색할 논문 개수 (최신순)",
         min_value=1,
-        max_value=10,
+        max_value=MAX_ARXIV_RESULTS,
         value=3,
         step=1
     )
@@ -259,105 +350,152 @@ with st.sidebar:
 
     st.divider()
 
-    # 4. 최근 대화 목록
+    # 4. 최근 대화 목록 (대화마다 위젯을 만들지 않고 선택 상자 하나로 표시)
     st.subheader("🕒 최근 대화 목록")
-    sessions = get_all_sessions()
+    if "sidebar_limit" not in st.session_state:
+        st.session_state.sidebar_limit = SIDEBAR_PAGE_SIZE
+    # 다음 페이지가 있는지 확인하기 위해 한 개를 더 가져온다
+    sessions = get_all_sessions(limit=st.session_state.sidebar_limit + 1)
+    has_more_sessions = len(sessions) > st.session_state.sidebar_limit
+    sessions = sessions[:st.session_state.sidebar_limit]
     
-    for s_id, s_title, s_date in sessions:
-        with st.expander(f"{s_title} ({s_date})"):
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                new_name = st.text_input("제목", value=s_title, key=f"input_{s_id}", label_visibility="collapsed")
-            with col2:
-                if st.button("💾", key=f"save_{s_id}", use_container_width=True):
-                    update_session_title(s_id, new_name)
-                    st.rerun()
-
-            col_a, col_b = st.columns(2)
-            with col_a:
-                if st.button("📂 열기", key=f"open_{s_id}", use_container_width=True):
-                    st.session_state.current_session_id = s_id
-                    st.rerun()
-            with col_b:
-                if st.button("🗑️ 삭제", key=f"del_{s_id}", type="primary", use_container_width=True):
-                    delete_session(s_id)
-                    if st.session_state.current_session_id == s_id:
-                        st.session_state.current_session_id = None
-                    st.rerun()
+    session_labels = {s_id: f"{s_title} ({s_date})" for s_id, s_title, s_date in sessions}
+    if st.session_state.current_session_id not in session_labels:
+        # 목록 밖의 대화(검색으로 연 오래된 대화 등)도 선택된 상태로 보이도록 맨 앞에 추가
+        s_title, s_date = get_session_activity(st.session_state.current_session_id)
+        session_labels = {st.session_state.current_session_id: f"{s_title} ({s_date})", **session_labels}
+    st.session_state.session_picker = st.session_state.current_session_id
+    st.selectbox(
+        "대화 선택",
+        options=list(session_labels),
+        format_func=session_labels.get,
+        key="session_picker",
+        label_visibility="collapsed",
+        on_change=_pick_session
+    )
 
-# --- [메인 화면] ---
+    if has_more_sessions:
+        st.button("⬇️ 더 보기", use_container_width=True, on_click=_show_more_sessions)
 
-if not st.session_state.current_session_id:
-    all_sessions = get_all_sessions()
-    if all_sessions:
-        st.session_state.current_session_id = all_sessions[0][0]
-    else:
-        st.session_state.current_session_id = create_session()
+# --- [메인 화면] ---
 
-current_messages = get_messages(st.session_state.current_session_id)
+# 세션이 바뀔 때만 제목과 메시지를 한 번에 DB에서 읽는다
+if st.session_state.get("loaded_for") != st.session_state.current_session_id:
+    (session_title, session_date), st.session_state.messages_cache = get_session_view(st.session_state.current_session_id)
+    st.session_state.loaded_for = st.session_state.current_session_id
+    st.session_state.visible_messages = MESSAGE_PAGE_SIZE
+else:
+    session_title, session_date = get_session_info(st.session_state.current_session_id)
+current_messages = st.session_state.messages_cache
 is_first_message = len(current_messages) == 0
 
-session_title, session_date = get_session_info(st.session_state.current_session_id)
 st.title(f"🎓 {session_title}")
 st.caption(f"생성일: {session_date} | Paper Mate Pro")
 
-for msg in current_messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
+# 현재 대화의 제목 수정 / 삭제
+with st.expander("✏️ 대화 제목 수정 / 삭제"):
+    col1, col2, col3 = st.columns([4, 1, 1])
+    with col1:
+        st.text_input("제목", value=session_title, key=f"input_{st.session_state.current_session_id}",
+                      label_visibility="collapsed")
+    with col2:
+        st.button("💾 저장", key=f"save_{st.session_state.current_session_id}", use_container_width=True,
+                  on_click=_rename_session, args=(st.session_state.current_session_id,))
+    with col3:
+        st.button("🗑️ 삭제", key=f"del_{st.session_state.current_session_id}", type="primary",
+                  use_container_width=True, on_click=_delete_session, args=(st.session_state.current_session_id,))
+
+# 긴 대화도 최근 메시지만 그려 rerun마다 마크다운을 전부 다시 렌더링하지 않는다
+hidden_count = len(current_messages) - st.session_state.visible_messages
+if hidden_count > 0:
+    st.button(f"⬆️ 이전 메시지 보기 ({hidden_count}개)", on_click=_show_earlier_messages)
+for role, content in current_messages[max(hidden_count, 0):]:
+    with st.chat_message(role):
+        st.markdown(content)
 
 if prompt := st.chat_input("논문 주제를 입력하세요..."):
     
     st.chat_message("user").markdown(prompt)
-    save_message(st.session_state.current_session_id, "user", prompt)
+    # 사용자/답변 메시지는 답변 생성 후 한 트랜잭션으로 저장
+    turn_saved = False
 
     with st.spinner(f"🌏 '{prompt}' 검색 중... ({target_paper_count}개)"):
         try:
-            english_query = translate_to_english_keyword(prompt)
-            st.toast(f"검색어 변환: {english_query}")
-
-            search_context, paper_count = search_arxiv(english_query, max_results=target_paper_count)
+            english_query, search_context, paper_count = translate_and_search(prompt, max_results=target_paper_count)
+            history_summary, summary_count = get_session_summary(st.session_state.current_session_id)
+            if english_query != prompt:
+                st.toast(f"검색어 변환: {english_query}")
             
+            title_holder = {}
             if not search_context:
                 assistant_reply = "검색 결과가 없습니다."
             else:
-                full_prompt = f"""
-                사용자: '{prompt}'
-                
-                [지시사항]
-                1. 검색된 **{paper_count}개** 논문 모두에 대해 답변하세요.
-                2. 한국어 요약 필수.
-                3. 인용구는 **'{target_citation_style}'** 형식을 따르세요 (URL 필수 포함).
-                
-                [검색 데이터]
-                {search_context}
-                
-                --- 답변 형식 ---
-                ### [번호]. [제목] (연도)
-                * **요약:** (한국어)
-                * **Citation ({target_citation_style}):** (형식 준수, URL 포함)
-                * **PDF:** (URL)
-                ---
-                """
+                # 들여쓰기 없이 줄 단위로 구성해 프롬프트 토큰 낭비를 줄인다
+                instructions = [
+                    f"1. 검색된 **{paper_count}개** 논문 모두에 대해 답변하세요.",
+                    "2. 한국어 요약 필수.",
+                    f"3. 인용구는 **'{target_citation_style}'** 형식을 따르세요 (URL 필수 포함).",
+                ]
+                if is_first_message:
+                    instructions.append(f"4. 첫 줄에는 '{TITLE_PREFIX} (질문을 요약한 15자 이내 한국어 제목, 따옴표 없이)'만 쓰고 다음 줄부터 답변하세요.")
+                full_prompt = "\n".join([
+                    f"사용자: '{prompt}'",
+                    "",
+                    "[지시사항]",
+                    *instructions,
+                    "",
+                    "[검색 데이터]",
+                    search_context,
+                    "",
+                    "--- 답변 형식 ---",
+                    "### [번호]. [제목] (연도)",
+                    "* **요약:** (한국어)",
+                    f"* **Citation ({target_citation_style}):** (형식 준수, URL 포함)",
+                    "* **PDF:** (URL)",
+                    "---",
+                ])
                 messages_for_api = [{"role": "system", "content": "논문 검색 및 인용 전문가입니다."}]
-                messages_for_api.extend(current_messages)
+                if history_summary:
+                    messages_for_api.append({"role": "system", "content": f"이전 대화 요약: {history_summary}"})
+                # 요약에 들어간 메시지는 빼고 그 뒤의 메시지만 보낸다
+                messages_for_api.extend(trim_history(current_messages[summary_count:]))
                 messages_for_api.append({"role": "user", "content": full_prompt})
 
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=messages_for_api
-                )
-                assistant_reply = response.choices[0].message.content
-
             with st.chat_message("assistant"):
-                st.markdown(assistant_reply)
+                if search_context:
+                    stream = stream_chat(messages_for_api)
+                    if is_first_message:
+                        # 제목 줄은 첫 질문에만 요청하므로 그때만 걸러낸다
+                        stream = split_title_line(stream, title_holder)
+                    assistant_reply = st.write_stream(stream)
+                    if not assistant_reply or not assistant_reply.strip():
+                        # 제목 줄만 오고 본문이 비어 있으면 빈 답변을 저장하지 않는다
+                        # (write_stream은 아무것도 쓰지 않으면 빈 리스트를 돌려준다)
+                        raise ValueError("모델이 빈 답변을 보냈습니다. 다시 시도해주세요.")
+                else:
+                    st.markdown(assistant_reply)
             
-            save_message(st.session_state.current_session_id, "assistant", assistant_reply)
+            auto_title = None
+            if is_first_message:
+                # 모델이 제목 줄을 빠뜨렸을 때만 별도로 제목을 생성한다
+                auto_title = title_holder.get("title") or generate_auto_title(prompt)
+
+            # 두 메시지와 첫 턴의 제목을 한 번의 COMMIT으로 저장
+            save_messages_bulk(st.session_state.current_session_id,
+                               [("user", prompt), ("assistant", assistant_reply)],
+                               title=auto_title)
+            current_messages.append(("user", prompt))
+            current_messages.append(("assistant", assistant_reply))
+            turn_saved = True
+            maybe_refresh_summary(st.session_state.current_session_id, list(current_messages),
+                                  history_summary, summary_count)
             
             if is_first_message:
-                auto_title = generate_auto_title(prompt)
-                update_session_title(st.session_state.current_session_id, auto_title)
                 st.rerun()
             
         except Exception as e:
+            if not turn_saved:
+                save_message(st.session_state.current_session_id, "user", prompt)
+                current_messages.append(("user", prompt))
             st.error(f"오류: {e}")
 
@@ -0,0 +1,65 @@
+import functools
+import threading
+
+import arxiv
+import streamlit as st
+
+# --- [ArXiv 검색 함수] ---
+# 한 번의 검색에서 가져올 최대 논문 수 (사이드바 입력 상한과 같다)
+MAX_ARXIV_RESULTS = 10
+
+# ArXiv HTTP 요청 하나의 제한 시간 (초). 응답이 멈춘 요청이 스레드를 계속 붙잡지 않게 한다
+ARXIV_REQUEST_TIMEOUT = 10
+
+@st.cache_resource
+def get_arxiv_client():
+    # 모든 사용자가 클라이언트 하나를 공유해 요청 간격(delay_seconds)을 프로세스 전체에서 지킨다
+    client = arxiv.Client(page_size=MAX_ARXIV_RESULTS, delay_seconds=3, num_retries=3)
+    # arxiv.Client는 timeout 없이 요청하므로 내부 세션의 get에 기본 timeout을 넣는다
+    client._session.get = functools.partial(client._session.get, timeout=ARXIV_REQUEST_TIMEOUT)
+    return client
+
+@st.cache_resource
+def get_arxiv_lock():
+    # arxiv.Client의 요청 간격 계산은 스레드 안전하지 않으므로 검색을 한 번에 하나씩 실행한다
+    return threading.Lock()
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def fetch_arxiv(query, max_results=3):
+    # 예외는 캐시되지 않으므로 실패한 검색은 다음 요청에서 다시 시도된다
+    max_results = min(max_results, MAX_ARXIV_RESULTS)
+    search = arxiv.Search(
+        query=query,
+        max_results=max_results, 
+        sort_by=arxiv.SortCriterion.Relevance
+    )
+    client = get_arxiv_client()
+    with get_arxiv_lock():
+        # 한 번의 요청(페이지)으로 필요한 결과를 모두 받도록 검색마다 page_size를 맞춘다
+        client.page_size = max_results
+        results = list(client.results(search))
+    
+    if not results:
+        return None, 0
+
+    # 관련도 상위 결과만 받아 최신순으로 보여준다
+    results.sort(key=lambda x: x.published, reverse=True)
+
+    results_text = []
+    for result in results:
+        authors = ", ".join(author.name for author in result.authors)
+        # 초록의 줄바꿈과 연속 공백을 한 칸으로 합쳐 토큰을 아낀다
+        abstract = " ".join(result.summary.split())
+        
+        # 들여쓰기 없이 구성해 프롬프트 토큰 낭비를 줄인다
+        paper_data = (
+            f"[Paper ID: {result.entry_id}]\n"
+            f"- Title: {result.title}\n"
+            f"- Authors: {authors}\n"
+            f"- Published Year: {result.published.year}\n"
+            f"- Abstract: {abstract}\n"
+            f"- PDF Link: {result.pdf_url}"
+        )
+        results_text.append(paper_data)
+    
+    return "\n\n".join(results_text), len(results)
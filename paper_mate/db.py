@@ -0,0 +1,284 @@
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+import streamlit as st
+
+# --- [데이터베이스 관리 함수] ---
+DB_NAME = "chat_history.db"
+
+# 이 횟수의 스크립트 실행마다 WAL 체크포인트와 통계 갱신을 한다
+MAINTENANCE_INTERVAL = 200
+
+# 자주 쓰는 쿼리는 상수로 두어 같은 SQL 문자열이 연결의 statement 캐시에 계속 적중하게 한다
+# 생성 시각은 SQLite가 한국 시간(KST, UTC+9) 분 단위로 채운다.
+# 기본값 CURRENT_TIMESTAMP(UTC, 초 단위)를 쓰면 기존 행과 형식이 달라져 정렬과 표시가 어긋난다
+SQL_INSERT_SESSION = "INSERT INTO sessions (id, title, created_at) VALUES (?, ?, strftime('%Y-%m-%d %H:%M', 'now', '+9 hours'))"
+SQL_UPDATE_SESSION_TITLE = "UPDATE sessions SET title = ? WHERE id = ?"
+SQL_DELETE_SESSION_MESSAGES = "DELETE FROM messages WHERE session_id = ?"
+SQL_DELETE_SESSION = "DELETE FROM sessions WHERE id = ?"
+SQL_GET_SESSION_INFO = "SELECT title, created_at FROM sessions WHERE id = ?"
+SQL_INSERT_MESSAGE = "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)"
+SQL_GET_MESSAGES = "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id ASC"
+# 세션의 마지막 활동 시각. 마지막 메시지는 (session_id, id) 인덱스로 바로 찾고,
+# UTC로 저장되는 메시지 시각을 sessions.created_at과 같은 KST 분 단위 형식으로 맞춘다
+SQL_LAST_ACTIVITY = '''
+    COALESCE((SELECT strftime('%Y-%m-%d %H:%M', m.created_at, '+9 hours')
+              FROM messages m WHERE m.session_id = s.id
+              ORDER BY m.id DESC LIMIT 1), s.created_at)
+'''
+SQL_GET_ALL_SESSIONS = f"SELECT s.id, s.title, {SQL_LAST_ACTIVITY} AS last_at FROM sessions s ORDER BY last_at DESC LIMIT ? OFFSET ?"
+SQL_GET_SESSION_ACTIVITY = f"SELECT s.title, {SQL_LAST_ACTIVITY} FROM sessions s WHERE s.id = ?"
+# 시작 시 열 기본 대화는 idx_sessions_created_at 인덱스로 바로 찾는다
+SQL_MOST_RECENT_SESSION = "SELECT id FROM sessions ORDER BY created_at DESC LIMIT 1"
+SQL_GET_SESSION_SUMMARY = "SELECT summary, summary_count FROM sessions WHERE id = ?"
+# 늦게 끝난 이전 요약이 더 최신 요약을 덮어쓰지 않도록 요약 범위가 늘어날 때만 갱신
+SQL_UPDATE_SESSION_SUMMARY = "UPDATE sessions SET summary = ?, summary_count = ? WHERE id = ? AND summary_count < ?"
+# FTS 테이블의 session_id 열로 일치하는 메시지를 모은 뒤 세션별로 가장 점수가 좋은 한 건만 남기고 sessions와 한 번만 조인한다
+SQL_SEARCH_HISTORY = '''
+    WITH hits AS (
+        SELECT session_id,
+               snippet(messages_fts, 0, '[', ']', '…', 10) AS snip,
+               bm25(messages_fts) AS score
+        FROM messages_fts
+        WHERE messages_fts MATCH ?
+        ORDER BY score
+        LIMIT 500
+    ), best AS (
+        SELECT session_id, snip, MIN(score) AS score
+        FROM hits
+        GROUP BY session_id
+    )
+    SELECT s.id, s.title, best.snip
+    FROM best
+    JOIN sessions s ON s.id = best.session_id
+    ORDER BY best.score
+    LIMIT 50
+'''
+
+@st.cache_resource
+def get_conn():
+    # 프로세스당 하나의 연결을 공유 (autocommit 모드)
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False, isolation_level=None)
+    # 연결 단위 설정이므로 공유 연결을 만들 때 한 번만 적용하면 된다.
+    # page_size는 새 DB 파일에만 적용되므로 WAL 전환(첫 쓰기)보다 먼저 둔다
+    conn.executescript('''
+        PRAGMA page_size=16384;
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA mmap_size=268435456;
+        PRAGMA cache_size=-65536;
+    ''')
+    return conn
+
+@st.cache_resource
+def get_db_lock():
+    return threading.RLock()
+
+@st.cache_resource
+def get_db_version_box():
+    # 쓰기마다 올라가는 프로세스 전역 버전. 읽기 캐시(st.cache_data)의 키로 쓰여 쓰기 후 자동으로 무효화된다.
+    # st.cache_data는 모든 사용자가 공유하므로 사용자별 session_state가 아닌 여기에 둔다.
+    return {"version": 0}
+
+def db_version():
+    return get_db_version_box()["version"]
+
+def _bump_version():
+    get_db_version_box()["version"] += 1
+
+@st.cache_resource
+def init_db():
+    # 스키마 생성은 프로세스당 한 번만 실행한다 (rerun마다 DDL을 반복하지 않는다)
+    conn = get_conn()
+    with get_db_lock():
+        fts_row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        if fts_row and "session_id" not in fts_row[0]:
+            # session_id 열이 없던 예전 FTS 테이블은 지우고 아래에서 새로 만들어 다시 색인한다
+            conn.executescript('''
+                DROP TRIGGER IF EXISTS messages_fts_ai;
+                DROP TRIGGER IF EXISTS messages_fts_ad;
+                DROP TRIGGER IF EXISTS messages_fts_au;
+                DROP TABLE messages_fts;
+            ''')
+            fts_row = None
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                title TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                summary TEXT,
+                summary_count INTEGER DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                role TEXT,
+                content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(session_id) REFERENCES sessions(id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions(created_at DESC);
+
+            -- 대화 검색용 FTS5 인덱스 (messages 테이블을 외부 content로 사용, 트리거로 동기화)
+            -- session_id는 검색 대상이 아니라 결과를 세션별로 묶는 데만 쓰므로 UNINDEXED
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content,
+                session_id UNINDEXED,
+                content='messages',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts(rowid, content, session_id) VALUES (new.id, new.content, new.session_id);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content, session_id) VALUES ('delete', old.id, old.content, old.session_id);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content, session_id) VALUES ('delete', old.id, old.content, old.session_id);
+                INSERT INTO messages_fts(rowid, content, session_id) VALUES (new.id, new.content, new.session_id);
+            END;
+        ''')
+        if not fts_row:
+            # 기존 대화 기록을 한 번만 색인
+            conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        # 요약 열이 없던 예전 DB에 열을 추가
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "summary" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT")
+        if "summary_count" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN summary_count INTEGER DEFAULT 0")
+        # 쿼리 플래너가 위 인덱스를 고를 수 있도록 통계를 갱신 (프로세스 시작 시 한 번)
+        conn.execute("ANALYZE")
+    return True
+
+@st.cache_resource
+def get_maintenance_counter():
+    return {"runs": 0}
+
+def maybe_maintain_db():
+    # WAL 파일이 계속 커지지 않도록 주기적으로 체크포인트하고, 플래너 통계를 필요할 때만 갱신한다
+    counter = get_maintenance_counter()
+    with get_db_lock():
+        counter["runs"] += 1
+        if counter["runs"] % MAINTENANCE_INTERVAL:
+            return
+        conn = get_conn()
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        conn.execute("PRAGMA optimize")
+
+def create_session(title="새로운 대화"):
+    session_id = str(uuid.uuid4())
+    with get_db_lock():
+        get_conn().execute(SQL_INSERT_SESSION, (session_id, title))
+        _bump_version()
+    return session_id
+
+def update_session_title(session_id, new_title):
+    with get_db_lock():
+        get_conn().execute(SQL_UPDATE_SESSION_TITLE, (new_title, session_id))
+        _bump_version()
+
+@contextmanager
+def transaction():
+    # 여러 쓰기를 한 번의 COMMIT으로 묶는다
+    conn = get_conn()
+    with get_db_lock():
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        _bump_version()
+
+def delete_session(session_id):
+    with transaction() as conn:
+        conn.execute(SQL_DELETE_SESSION_MESSAGES, (session_id,))
+        conn.execute(SQL_DELETE_SESSION, (session_id,))
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _get_session_info_cached(session_id, version):
+    with get_db_lock():
+        row = get_conn().execute(SQL_GET_SESSION_INFO, (session_id,)).fetchone()
+    return row if row else ("알 수 없음", "")
+
+def get_session_info(session_id):
+    return _get_session_info_cached(session_id, db_version())
+
+def get_session_summary(session_id):
+    # (요약, 요약에 포함된 앞쪽 메시지 수). 요약이 없으면 (None, 0)
+    with get_db_lock():
+        row = get_conn().execute(SQL_GET_SESSION_SUMMARY, (session_id,)).fetchone()
+    return (row[0], row[1] or 0) if row else (None, 0)
+
+def update_session_summary(session_id, summary, summary_count):
+    with get_db_lock():
+        get_conn().execute(SQL_UPDATE_SESSION_SUMMARY, (summary, summary_count, session_id, summary_count))
+        _bump_version()
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _get_session_activity_cached(session_id, version):
+    with get_db_lock():
+        row = get_conn().execute(SQL_GET_SESSION_ACTIVITY, (session_id,)).fetchone()
+    return row if row else ("알 수 없음", "")
+
+def get_session_activity(session_id):
+    # (title, 마지막 활동 시각). 사이드바 목록과 같은 기준의 시각을 돌려준다
+    return _get_session_activity_cached(session_id, db_version())
+
+def save_message(session_id, role, content):
+    with get_db_lock():
+        get_conn().execute(SQL_INSERT_MESSAGE, (session_id, role, content))
+        _bump_version()
+
+def save_messages_bulk(session_id, pairs, title=None):
+    # title을 주면 제목 변경도 같은 트랜잭션(COMMIT 한 번)에 포함한다
+    with transaction() as conn:
+        conn.executemany(SQL_INSERT_MESSAGE,
+                         [(session_id, role, content) for role, content in pairs])
+        if title:
+            conn.execute(SQL_UPDATE_SESSION_TITLE, (title, session_id))
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _get_session_view_cached(session_id, version):
+    # 한 번의 잠금 안에서 두 쿼리를 실행하므로 그 사이에 끼어드는 쓰기 없이 같은 상태를 본다
+    conn = get_conn()
+    with get_db_lock():
+        info = conn.execute(SQL_GET_SESSION_INFO, (session_id,)).fetchone()
+        messages = conn.execute(SQL_GET_MESSAGES, (session_id,)).fetchall()
+    return (info if info else ("알 수 없음", "")), messages
+
+def get_session_view(session_id):
+    # ((title, created_at), [(role, content), ...])
+    return _get_session_view_cached(session_id, db_version())
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _get_all_sessions_cached(limit, offset, version):
+    with get_db_lock():
+        return get_conn().execute(SQL_GET_ALL_SESSIONS, (limit, offset)).fetchall()
+
+def get_all_sessions(limit=30, offset=0):
+    # (id, title, 마지막 활동 시각) 목록을 최근 활동 순으로 돌려준다
+    return _get_all_sessions_cached(limit, offset, db_version())
+
+def most_recent_session_id():
+    with get_db_lock():
+        row = get_conn().execute(SQL_MOST_RECENT_SESSION).fetchone()
+    return row[0] if row else None
+
+def to_fts_query(keyword):
+    # 단어별 접두어 검색으로 변환 ("논문" → 논문을, 논문의 ...). 따옴표로 FTS 문법 오류 방지
+    return " ".join('"' + token.replace('"', '""') + '"*' for token in keyword.split())
+
+def search_history(keyword):
+    fts_query = to_fts_query(keyword)
+    if not fts_query:
+        return []
+    with get_db_lock():
+        return get_conn().execute(SQL_SEARCH_HISTORY, (fts_query,)).fetchall()